@@ -1,7 +1,36 @@
 from flask import Flask, redirect, url_for
 from flask_login import LoginManager, current_user
+from flask_session import Session
+from flask_session.base import Serializer
+from sqlalchemy import event
 from models import db, User
 import os
+import orjson
+
+
+def _set_sqlite_pragmas(dbapi_conn, _record):
+    # WAL lets readers proceed while a commit holds the write lock
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.close()
+
+
+class OrjsonSessionSerializer(Serializer):
+    """Flask-Session serializer backed by orjson (quiz_data is read on every question)."""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def encode(self, session):
+        return orjson.dumps(dict(session))
+
+    def decode(self, serialized_data):
+        try:
+            return orjson.loads(serialized_data)
+        except orjson.JSONDecodeError:
+            # sessions stored before the switch use Flask-Session's own format
+            return self.fallback.decode(serialized_data)
 
 
 def create_app():
@@ -16,6 +45,12 @@ def create_app():
     app.config.from_pyfile('../config.py')
 
     db.init_app(app)
+    Session(app)
+    app.session_interface.serializer = OrjsonSessionSerializer(app.session_interface.serializer)
+
+    with app.app_context():
+        if db.engine.dialect.name == "sqlite":
+            event.listen(db.engine, "connect", _set_sqlite_pragmas)
 
     login_manager = LoginManager()
     login_manager.init_app(app)
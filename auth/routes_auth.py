@@ -1,10 +1,33 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from models import db, User
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
 from flask_login import login_user, logout_user, login_required
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 
 auth_bp = Blueprint('auth_bp', __name__)
 
+# argon2id; the C backend releases the GIL while hashing
+_PH = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=2)
+
+def verify_password(user, password):
+    if user.password.startswith("$argon2"):
+        try:
+            _PH.verify(user.password, password)
+        except (VerificationError, InvalidHashError):
+            return False
+        if _PH.check_needs_rehash(user.password):
+            user.password = _PH.hash(password)
+            db.session.commit()
+        return True
+
+    # legacy Werkzeug (pbkdf2/scrypt) hash: check once, then upgrade to argon2
+    if check_password_hash(user.password, password):
+        user.password = _PH.hash(password)
+        db.session.commit()
+        return True
+    return False
+
 @auth_bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
@@ -16,7 +39,7 @@ def register():
             flash("Email already exists!")
             return redirect(url_for('auth_bp.register'))
 
-        hashed = generate_password_hash(password)
+        hashed = _PH.hash(password)
 
 
         new_user = User(email=email, password=hashed)
@@ -35,7 +58,7 @@ def login():
         password = request.form['password']
 
         user = User.query.filter_by(email=email).first()
-        if user and check_password_hash(user.password, password):
+        if user and verify_password(user, password):
             login_user(user)
             return redirect(url_for('home'))
         else:
@@ -1,4 +1,5 @@
 import os
+import redis
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,3 +10,18 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 SQLALCHEMY_DATABASE_URI = 'sqlite:///users.db'
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# server-side sessions (Flask-Session); quiz state is too large for a cookie
+SESSION_TYPE = 'redis'
+SESSION_REDIS = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+# sized for gevent workers; the default pool (5) queues concurrent requests
+SQLALCHEMY_ENGINE_OPTIONS = {
+    "pool_size": 20,
+    "max_overflow": 40,
+    "pool_pre_ping": True,
+    "pool_recycle": 3600,
+}
+if SQLALCHEMY_DATABASE_URI.startswith("sqlite"):
+    # pooled connections get handed between threads/greenlets
+    SQLALCHEMY_ENGINE_OPTIONS["connect_args"] = {"check_same_thread": False}
@@ -13,6 +13,7 @@ import pytesseract
 pytesseract.pytesseract.tesseract_cmd = r"C:\\Program Files\\Tesseract-OCR\\tesseract.exe"
 
 # DB models
+from sqlalchemy.orm import undefer
 from models import Document, db
 
 # Summarizer (BART)
@@ -134,7 +135,9 @@ def extract_text_from_file(save_path: str, filename: str) -> str:
     return text
 
 def get_latest_doc(user_id: int):
-    return Document.query.filter_by(user_id=user_id).order_by(Document.id.desc()).first()
+    # upload/summary pages render both text columns, so load them up front
+    return (Document.query.options(undefer(Document.extracted_text), undefer(Document.summary))
+            .filter_by(user_id=user_id).order_by(Document.id.desc()).first())
 
 # ------------------- Routes -------------------
 @docs_bp.route('/upload', methods=['GET','POST'])
@@ -7,13 +7,25 @@ class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(150), unique=True, nullable=False)
     password = db.Column(db.String(300), nullable=False)
+    # running quiz totals, updated with each QuizResult (avoids SUM() scans)
+    total_score = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    total_questions = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    quizzes_taken = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
 class Document(db.Model):
+    # serves "latest document for user": filter by user_id, ORDER BY id DESC
+    __table_args__ = (db.Index('ix_doc_user_id_desc', 'user_id', 'id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     filename = db.Column(db.String(200))
-    extracted_text = db.Column(db.Text)
-    summary = db.Column(db.Text)
+    # large TEXT blobs; only loaded when accessed or explicitly undeferred
+    extracted_text = db.Column(db.Text, deferred=True)
+    summary = db.Column(db.Text, deferred=True)
+    # Gemini context cache holding extracted_text (quiz generation): its name
+    # (or "uncacheable") and when it expires (UTC), so live caches aren't re-checked
+    gemini_cache_name = db.Column(db.String(200))
+    gemini_cache_expires = db.Column(db.DateTime)
 
 class DocChunk(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -30,3 +42,9 @@ class QuizResult(db.Model):
     score = db.Column(db.Integer, nullable=False)
     total = db.Column(db.Integer, nullable=False)
     timestamp = db.Column(db.DateTime, server_default=db.func.current_timestamp())
+
+    @classmethod
+    def bulk_create(cls, records):
+        # imports / backfills: one batched INSERT instead of add() per row
+        db.session.bulk_save_objects(records)
+        db.session.commit()
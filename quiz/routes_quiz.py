@@ -1,28 +1,123 @@
-import os, json, re
-from flask import render_template, request, redirect, url_for, flash, session
+import os, re, datetime
+import orjson
+from cachetools import TTLCache
+from flask import render_template, request, redirect, url_for, flash, session, jsonify
 from flask_login import login_required, current_user
 from quiz import quiz_bp
-from models import Document, QuizResult, db
+from sqlalchemy import func
+from sqlalchemy.orm import load_only
+from models import Document, QuizResult, User, db
 import google.generativeai as genai
+from google.api_core.exceptions import InvalidArgument, NotFound
 
 # ---- Gemini setup ----
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 GEN_MODEL = "models/gemini-2.5-flash"   # fast and good for MCQs
+_MODEL = genai.GenerativeModel(GEN_MODEL)  # built once, reused across requests
+CACHE_TTL = datetime.timedelta(hours=1)  # explicit context cache lifetime
+CACHE_MARGIN = datetime.timedelta(minutes=2)  # stop reusing a cache this close to expiry
+MIN_CACHE_CHARS = 8000  # ~2k tokens; below this Gemini refuses explicit caches
+UNCACHEABLE = "uncacheable"  # gemini_cache_name marker: creation was rejected
+MAX_PROMPT_CHARS = 30000  # plenty of material for 50 MCQs; caps tokens per call
+
+_FENCE_RE = re.compile(r"```(?:json)?(.*?)```", re.S | re.I)
+LABELS = ("A)", "B)", "C)", "D)")
+
+# ---- generated quiz cache (per process) ----
+# key: (doc_id, num, difficulty, hash of text head) -> normalized question list
+_QUIZ_CACHE = TTLCache(maxsize=1024, ttl=3600)
+_QUIZ_CACHE_STATS = {"hits": 0, "misses": 0}
+
+# models bound to live context caches in this process, by cache name
+_CACHED_MODELS = {}
 
 # ---- helpers ----
-def get_latest_doc(user_id: int):
-    return Document.query.filter_by(user_id=user_id).order_by(Document.id.desc()).first()
+def get_latest_doc_id(user_id: int):
+    # id of the latest document, or None if there is none or it has no text;
+    # the emptiness check runs in SQL so the text itself isn't fetched
+    has_text = func.length(func.trim(Document.extracted_text, " \t\r\n")) > 0
+    row = (db.session.query(Document.id, has_text)
+           .filter_by(user_id=user_id).order_by(Document.id.desc()).first())
+    return row[0] if row and row[1] else None
+
+def get_doc_with_text(doc_id: int):
+    # only what quiz generation reads: the text and its context cache state
+    return (Document.query
+            .options(load_only(Document.extracted_text, Document.gemini_cache_name,
+                               Document.gemini_cache_expires))
+            .get(doc_id))
+
+def build_doc_prefix(text: str) -> str:
+    return f"""
+You are an expert MCQ quiz generator.
+
+DOCUMENT TEXT:
+{text}
+"""
+
+def get_cached_model(doc, text: str):
+    """
+    Return a model bound to a Gemini context cache holding the document text,
+    creating the cache on first use and remembering its name and expiry on
+    the Document. Returns None when the document is too short for explicit
+    caching (Gemini rejects small caches), in which case the caller sends the
+    full prompt and relies on implicit prefix caching.
+    """
+    if len(text) < MIN_CACHE_CHARS or doc.gemini_cache_name == UNCACHEABLE:
+        return None
+
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    name = doc.gemini_cache_name
+    if name and doc.gemini_cache_expires and doc.gemini_cache_expires > now + CACHE_MARGIN:
+        model = _CACHED_MODELS.get(name)
+        if model is not None:
+            return model
+        try:
+            # live cache created by another worker / before a restart
+            model = genai.GenerativeModel.from_cached_content(cached_content=name)
+        except NotFound:
+            model = None  # deleted early; create a fresh one below
+        if model is not None:
+            _CACHED_MODELS[name] = model
+            return model
+
+    try:
+        cache = genai.caching.CachedContent.create(
+            model=GEN_MODEL,
+            contents=[build_doc_prefix(text)],
+            ttl=CACHE_TTL,
+        )
+    except InvalidArgument:
+        # e.g. still under the model's minimum; don't try again for this doc
+        doc.gemini_cache_name = UNCACHEABLE
+        doc.gemini_cache_expires = None
+        db.session.commit()
+        return None
+
+    doc.gemini_cache_name = cache.name
+    doc.gemini_cache_expires = now + CACHE_TTL
+    db.session.commit()
+    model = genai.GenerativeModel.from_cached_content(cached_content=cache)
+    _CACHED_MODELS[cache.name] = model
+    return model
 
 def clamp(n, lo, hi):
     return max(lo, min(n, hi))
 
+def clip_text(text: str, limit: int = MAX_PROMPT_CHARS) -> str:
+    # long documents: keep the start and the end, drop the middle
+    if len(text) <= limit:
+        return text
+    half = limit // 2
+    return text[:half] + "\n...\n" + text[-half:]
+
 def extract_json_block(text: str) -> str:
     """
     Gemini sometimes wraps JSON in code fences or adds prose.
     This extracts the first JSON array block.
     """
     # strip code fences if present
-    fenced = re.search(r"```(?:json)?(.*?)```", text, re.S | re.I)
+    fenced = _FENCE_RE.search(text)
     if fenced:
         text = fenced.group(1).strip()
     # find first [...] block
@@ -30,38 +125,25 @@ def extract_json_block(text: str) -> str:
     end = text.rfind("]")
     if start != -1 and end != -1 and end > start:
         return text[start:end+1]
-    return text  # fallback; let json.loads handle or fail
+    return text  # fallback; let orjson.loads handle or fail
 
-# =========================================================
-#  START QUIZ: show form (GET) / generate (POST)
-# =========================================================
-@quiz_bp.route("/quiz/start", methods=["GET", "POST"])
-@login_required
-def start_quiz():
-    latest = get_latest_doc(current_user.id)
-    if not latest or not (latest.extracted_text or "").strip():
-        flash("Please upload a document first.", "warning")
-        return redirect(url_for("docs_bp.upload"))
+def gemini_chunk_text(chunk) -> str:
+    # .text raises ValueError on chunks without text parts (e.g. finish-only)
+    try:
+        return chunk.text
+    except (AttributeError, ValueError):
+        return ""
 
-    if request.method == "POST":
-        # ---- collect inputs ----
-        try:
-            num = int(request.form.get("num_questions", "5"))
-        except Exception:
-            num = 5
-        num = clamp(num, 1, 50)  # MAX = 50 as requested
-
-        difficulty = (request.form.get("difficulty") or "medium").lower()
-        if difficulty not in ("easy", "medium", "hard"):
-            difficulty = "medium"
-
-        text = latest.extracted_text
-
-        # ---- build prompt ----
-        prompt = f"""
-You are an expert MCQ quiz generator.
-
-Generate {num} multiple-choice questions strictly based on the DOCUMENT TEXT below.
+def generate_quiz(doc, text: str, num: int, difficulty: str):
+    """
+    Ask Gemini for `num` MCQs on `text` and return the normalized question
+    list, or None when the reply could not be parsed.
+    """
+    # ---- build prompt ----
+    # document text goes first and the per-request instructions last, so
+    # the large prefix is identical across quizzes and can be cached
+    instructions = f"""
+Generate {num} multiple-choice questions strictly based on the DOCUMENT TEXT above.
 Difficulty: {difficulty}
 
 Rules:
@@ -79,48 +161,94 @@ JSON schema example:
     "explanation": "one sentence explanation"
   }}
 ]
-
-DOCUMENT TEXT:
-{text}
 """
 
-        model = genai.GenerativeModel(GEN_MODEL)
-        resp = model.generate_content(prompt)
-        raw = getattr(resp, "text", "").strip()
+    model = get_cached_model(doc, text)
+    if model is not None:
+        prompt = instructions
+    else:
+        model, prompt = _MODEL, build_doc_prefix(text) + instructions
+
+    # ---- stream the reply, then parse it once ----
+    stream = model.generate_content(prompt, stream=True)
+    raw = "".join(gemini_chunk_text(chunk) for chunk in stream).strip()
+
+    # ---- robust parse ----
+    json_str = extract_json_block(raw)
+    try:
+        data = orjson.loads(json_str.encode() if isinstance(json_str, str) else json_str)
+        assert isinstance(data, list) and len(data) > 0
+    except Exception:
+        return None
+
+    # normalize options to ensure ["A) ..", "B) ..", ...]
+    for q in data:
+        # ensure strings and trimmed
+        opts = [str(o).strip() for o in (q.get("options") or [])[:4]]
+        # if options don't start with A)/B) etc., add them
+        q["options"] = [o if o.upper().startswith(LABELS[i]) else f"{LABELS[i]} {o}"
+                        for i, o in enumerate(opts)]
+
+        # ensure correct is one of A/B/C/D
+        corr = (q.get("correct") or "").strip().upper()
+        if corr not in ("A", "B", "C", "D"):
+            q["correct"] = "A"
+
+        # ensure explanation exists
+        if not q.get("explanation"):
+            q["explanation"] = "No explanation provided."
+
+    return data
 
-        # ---- robust parse ----
-        json_str = extract_json_block(raw)
+# =========================================================
+#  START QUIZ: show form (GET) / generate (POST)
+# =========================================================
+@quiz_bp.route("/quiz/start", methods=["GET", "POST"])
+@login_required
+def start_quiz():
+    doc_id = get_latest_doc_id(current_user.id)
+    if doc_id is None:
+        flash("Please upload a document first.", "warning")
+        return redirect(url_for("docs_bp.upload"))
+
+    if request.method == "POST":
+        # only the POST branch consumes the document text
+        latest = get_doc_with_text(doc_id)
+        if not latest or not (latest.extracted_text or "").strip():
+            flash("Please upload a document first.", "warning")
+            return redirect(url_for("docs_bp.upload"))
+
+        # ---- collect inputs ----
         try:
-            data = json.loads(json_str)
-            assert isinstance(data, list) and len(data) > 0
+            num = int(request.form.get("num_questions", "5"))
         except Exception:
-            flash("Quiz generation failed to parse JSON. Please try again.", "danger")
-            return redirect(url_for("quiz_bp.start_quiz"))
-
-        # normalize options to ensure ["A) ..", "B) ..", ...]
-        for q in data:
-            opts = q.get("options", [])
-            # ensure strings and trimmed
-            q["options"] = [str(o).strip() for o in opts[:4]]
-            # if options don't start with A)/B) etc., add them
-            labels = ["A)", "B)", "C)", "D)"]
-            for i, o in enumerate(q["options"]):
-                if not o.strip().upper().startswith(labels[i]):
-                    q["options"][i] = f"{labels[i]} {o}"
-
-            # ensure correct is one of A/B/C/D
-            corr = (q.get("correct") or "").strip().upper()
-            if corr not in ("A", "B", "C", "D"):
-                q["correct"] = "A"
-
-            # ensure explanation exists
-            if not q.get("explanation"):
-                q["explanation"] = "No explanation provided."
+            num = 5
+        num = clamp(num, 1, 50)  # MAX = 50 as requested
+
+        difficulty = (request.form.get("difficulty") or "medium").lower()
+        if difficulty not in ("easy", "medium", "hard"):
+            difficulty = "medium"
+
+        text = clip_text(latest.extracted_text)
+
+        # ---- reuse a recent quiz for the same document + settings ----
+        # (?nocache=1 forces a fresh generation, handy while developing)
+        cache_key = (doc_id, num, difficulty, hash(text[:200]))
+        data = None
+        if request.args.get("nocache") != "1":
+            data = _QUIZ_CACHE.get(cache_key)
+        if data is not None:
+            _QUIZ_CACHE_STATS["hits"] += 1
+        else:
+            _QUIZ_CACHE_STATS["misses"] += 1
+            data = generate_quiz(latest, text, num, difficulty)
+            if data is None:
+                flash("Quiz generation failed to parse JSON. Please try again.", "danger")
+                return redirect(url_for("quiz_bp.start_quiz"))
+            _QUIZ_CACHE[cache_key] = data
 
         # ---- init session state ----
         session["quiz_data"] = data
-        session["quiz_index"] = 0
-        session["quiz_score"] = 0
 
         return redirect(url_for("quiz_bp.show_question"))
 
@@ -128,73 +256,62 @@ DOCUMENT TEXT:
     return render_template("quiz_start.html")
 
 # =========================================================
-#  SHOW QUESTION (GET) / SUBMIT ANSWER (POST)
+#  QUIZ CACHE STATS (GET): hit/miss counts for this worker process
+# =========================================================
+@quiz_bp.route("/quiz/cache_stats", methods=["GET"])
+@login_required
+def quiz_cache_stats():
+    return jsonify(size=len(_QUIZ_CACHE), **_QUIZ_CACHE_STATS)
+
+# =========================================================
+#  SHOW QUIZ (GET): all questions on one page
 # =========================================================
 @quiz_bp.route("/quiz/q", methods=["GET"])
 @login_required
 def show_question():
     data = session.get("quiz_data")
-    idx  = session.get("quiz_index", 0)
     if not data:
         flash("Please generate a quiz first.", "warning")
         return redirect(url_for("quiz_bp.start_quiz"))
 
-    # end guard
-    if idx >= len(data):
-        return redirect(url_for("quiz_bp.show_result"))
-
-    q = data[idx]
     return render_template(
         "quiz_question.html",
-        qnum=idx + 1,
         total=len(data),
-        question=q
+        questions=data
     )
 
-@quiz_bp.route("/quiz/answer", methods=["POST"])
-@login_required
-def submit_answer():
-    data = session.get("quiz_data", [])
-    idx  = session.get("quiz_index", 0)
-    score = session.get("quiz_score", 0)
-
-    if idx >= len(data):
-        return redirect(url_for("quiz_bp.show_result"))
-
-    selected = (request.form.get("answer") or "").strip().upper()
-    correct  = (data[idx].get("correct") or "").strip().upper()
-
-    if selected == correct:
-        score += 1
-
-    # store per-question feedback to show instantly (optional)
-    session["last_explanation"] = data[idx].get("explanation", "")
-
-    idx += 1
-    session["quiz_index"] = idx
-    session["quiz_score"] = score
-
-    if idx >= len(data):
-        return redirect(url_for("quiz_bp.show_result"))
-    return redirect(url_for("quiz_bp.show_question"))
-
 # =========================================================
-#  RESULT PAGE (stores in DB as requested)
+#  SUBMIT ALL ANSWERS (POST): score, store in DB, show result
 # =========================================================
-@quiz_bp.route("/quiz/result", methods=["GET"])
+@quiz_bp.route("/quiz/submit_all", methods=["POST"])
 @login_required
-def show_result():
-    data = session.get("quiz_data", [])
+def submit_all():
+    data = session.get("quiz_data")
+    if not data:
+        flash("Please generate a quiz first.", "warning")
+        return redirect(url_for("quiz_bp.start_quiz"))
+
     total = len(data)
-    score = session.get("quiz_score", 0)
+    answers = [(request.form.get(f"answer_{i}") or "").strip().upper() for i in range(total)]
+    score = sum(1 for i, a in enumerate(answers)
+                if a == (data[i].get("correct") or "").strip().upper())
 
     # Save to DB as requested
-    if total > 0:
-        rec = QuizResult(user_id=current_user.id, score=score, total=total)
-        db.session.add(rec)
-        db.session.commit()
-
-    percent = (score / total * 100) if total else 0
+    rec = QuizResult(user_id=current_user.id, score=score, total=total)
+    db.session.add(rec)
+    # keep the per-user running totals in the same transaction; the increment
+    # happens in SQL so concurrent submits can't lose an update
+    User.query.filter_by(id=current_user.id).update({
+        User.total_score: User.total_score + score,
+        User.total_questions: User.total_questions + total,
+        User.quizzes_taken: User.quizzes_taken + 1,
+    })
+    db.session.commit()
+
+    # quiz is done; a resubmit must not record it twice
+    session.pop("quiz_data", None)
+
+    percent = score / total * 100
     if percent < 40:
         feedback = "Needs Practice"
     elif percent < 70:
@@ -202,10 +319,5 @@ def show_result():
     else:
         feedback = "Excellent!"
 
-    # (optional) clear quiz session
-    # session.pop("quiz_data", None)
-    # session.pop("quiz_index", None)
-    # session.pop("quiz_score", None)
-
     return render_template("quiz_result.html",
                            score=score, total=total, feedback=feedback)
@@ -0,0 +1,13 @@
+# Production entrypoint:
+#   gunicorn -k gevent -w 4 --worker-connections 1000 wsgi:app
+#
+# gevent must patch socket/ssl before Flask and the Gemini client are
+# imported, so blocking Gemini/SQLite calls yield to other requests.
+from gevent import monkey
+monkey.patch_all()
+
+# google.generativeai talks gRPC by default; make it gevent-aware too
+import grpc.experimental.gevent as grpc_gevent  # noqa: E402
+grpc_gevent.init_gevent()
+
+from app import app  # noqa: E402,F401